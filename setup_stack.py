@@ -11,85 +11,247 @@ This script (re)creates the v0.1.6 stack layout with:
 - setup_oauth.sh helper
 - ZIP archive of the generated directory
 
-All actions/errors are logged to:
-- create_stack_actions.log
-- create_stack_errors.log
+All actions/errors are logged to create_stack.log ([INFO] / [ERROR] lines).
+
+Environment:
+- STACK_ZIP_LEVEL: 0 (default) stores files uncompressed; 1-9 deflates
+  the archive at that compression level.
+- STACK_WRITE_WORKERS: number of threads used to write the generated
+  files (default 4, or 1 on Windows); 1 writes them serially.
+- STACK_QUIET: if set (and not "0"), info lines are only written to the
+  log file, not mirrored to stdout. Errors always go to stderr.
 """
 
-import datetime
+import atexit
+import io
 import textwrap
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import (
+    BinaryIO,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 import os
 import stat
 import zipfile
 import sys
+import time
 
 VERSION = "0.1.6"
 STACK_DIR_NAME = "modular_cpu_ai_stack_v0_1_6"
+# Timestamp stamped on every generated ZIP entry (the ZIP epoch).
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
 
 ROOT_DIR = Path(__file__).resolve().parent
-ACTIONS_LOG = ROOT_DIR / "create_stack_actions.log"
-ERRORS_LOG = ROOT_DIR / "create_stack_errors.log"
+STACK_LOG = ROOT_DIR / "create_stack.log"
+
+# Cache for timestamp_utc(); log lines within the same second share a string.
+_LAST_SEC = -1
+_LAST_TS = ""
+
+_QUIET = os.environ.get("STACK_QUIET", "") not in ("", "0")
+
+# The log handle is opened lazily on first use and kept open (buffered) until
+# interpreter exit, instead of reopening the file for every message. It is
+# binary; _write_log encodes each line once instead of going through a text
+# wrapper.
+_LOG_FH: Optional[BinaryIO] = None
 
 
 def timestamp_utc() -> str:
-    return datetime.datetime.now(datetime.timezone.utc).strftime(
-        "%Y-%m-%dT%H:%M:%SZ"
-    )
+    """UTC timestamp to the second, reformatted only when the second changes."""
+    global _LAST_SEC, _LAST_TS
+    sec = int(time.time())
+    if sec != _LAST_SEC:
+        _LAST_TS = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(sec))
+        _LAST_SEC = sec
+    return _LAST_TS
+
 
+def _write_log(line: str) -> None:
+    global _LOG_FH
+    if _LOG_FH is None:
+        STACK_LOG.parent.mkdir(parents=True, exist_ok=True)
+        _LOG_FH = STACK_LOG.open("ab", buffering=64 * 1024)
+    _LOG_FH.write(line.encode("utf-8"))
 
-def _append_log(path: Path, line: str) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("a", encoding="utf-8") as f:
-        f.write(line)
+
+def _close_log() -> None:
+    """Flush and close the log handle (registered with atexit)."""
+    global _LOG_FH
+    if _LOG_FH is not None:
+        _LOG_FH.close()
+        _LOG_FH = None
+
+
+atexit.register(_close_log)
 
 
 def log_info(message: str) -> None:
     ts = timestamp_utc()
     line = f"{ts} [INFO] [setup_stack.py]: {message}\n"
-    _append_log(ACTIONS_LOG, line)
-    print(line, end="")
+    _write_log(line)
+    if not _QUIET:
+        sys.stdout.write(line)
 
 
 def log_error(message: str) -> None:
     ts = timestamp_utc()
     line = (
         f"{ts} [ERROR] [setup_stack.py]: {message} "
-        f"(see {ERRORS_LOG} for details)\n"
+        f"(see {STACK_LOG} for details)\n"
     )
-    _append_log(ERRORS_LOG, line)
-    print(line, end="", file=sys.stderr)
+    _write_log(line)
+    sys.stderr.write(line)
+
 
+def _file_mode(relpath: str) -> int:
+    """Shell scripts are generated executable; everything else is 0o644."""
+    return 0o755 if relpath.endswith(".sh") else 0o644
 
-def safe_write(path: Path, content: str) -> None:
-    """Write a text file, creating parents. Content is dedented and stripped."""
+
+def _write_text(path: str, content: Union[str, bytes], mode: int) -> bool:
+    """Write content atomically, with its final permissions set on the open fd.
+
+    Data goes straight to os.write on a raw fd (binary, no newline
+    translation, so scripts keep LF endings on every platform). Files whose
+    current content already matches are left untouched (only their mode is
+    corrected), so re-runs don't rewrite anything. Otherwise the content
+    goes to "<name>.part" and is renamed over path, so a crash never leaves
+    a truncated file. Returns True if the file was written.
+    """
+    data = content if isinstance(content, bytes) else content.encode("utf-8")
     try:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        text = textwrap.dedent(content).lstrip("\n")
-        path.write_text(text, encoding="utf-8")
-        log_info(f"Wrote file: {path}")
-    except Exception as exc:
-        log_error(f"Failed to write {path}: {exc}")
+        with open(path, "rb") as f:
+            unchanged = f.read() == data
+        if unchanged:
+            if stat.S_IMODE(os.stat(path).st_mode) != mode:
+                os.chmod(path, mode)
+            return False
+    except FileNotFoundError:
+        pass
+
+    tmp_path = path + ".part"
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    fd = os.open(tmp_path, flags, mode)
+    try:
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view) :]
+            # The mode passed to os.open is filtered by umask and ignored for
+            # existing files, so set it explicitly.
+            if hasattr(os, "fchmod"):
+                os.fchmod(fd, mode)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
         raise
+    return True
 
 
-def make_executable(path: Path) -> None:
-    """Mark a file as executable for user/group/others."""
+def _write_workers() -> int:
+    """Number of threads used to write files, from STACK_WRITE_WORKERS."""
+    default = "1" if os.name == "nt" else "4"
+    raw = os.environ.get("STACK_WRITE_WORKERS", default)
     try:
-        mode = path.stat().st_mode
-        path.chmod(mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
-        log_info(f"Marked executable: {path}")
-    except Exception as exc:
-        log_error(f"Failed to chmod +x {path}: {exc}")
-        raise
+        workers = int(raw)
+    except ValueError:
+        workers = 0
+    if workers < 1:
+        raise ValueError(
+            f"STACK_WRITE_WORKERS must be a positive integer, got {raw!r}"
+        )
+    return workers
+
+
+def materialize(stack_root: Path, entries: List[Tuple[str, str]]) -> List[Path]:
+    """Write generated (relpath, content) entries under stack_root in one pass.
+
+    Parent directories are created once per unique directory; content is
+    written as-is (templates are already dedented at import) and shell
+    scripts are created executable. Returns the paths whose content
+    changed; files that already matched are not rewritten.
+    """
+    # Paths are joined as plain strings; Path objects are only built for
+    # the files that changed.
+    root = os.fspath(stack_root)
+    join = os.path.join
+    paths = [join(root, relpath) for relpath, _ in entries]
+    for parent in sorted({os.path.dirname(path) for path in paths}):
+        try:
+            os.makedirs(parent, exist_ok=True)
+        except Exception as exc:
+            log_error(f"Failed to create directory {parent}: {exc}")
+            raise
+
+    # Directories exist before any write is submitted, so the writes are
+    # independent and can overlap on a thread pool.
+    writes = [
+        (path, content, _file_mode(relpath))
+        for path, (relpath, content) in zip(paths, entries)
+    ]
+    workers = _write_workers()
+    changed: List[Path] = []
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = [ex.submit(_write_text, *write) for write in writes]
+        for (path, _, _), future in zip(writes, futures):
+            try:
+                if future.result():
+                    changed.append(Path(path))
+            except Exception as exc:
+                log_error(f"Failed to write {path}: {exc}")
+                raise
+    else:
+        for path, content, mode in writes:
+            try:
+                if _write_text(path, content, mode):
+                    changed.append(Path(path))
+            except Exception as exc:
+                log_error(f"Failed to write {path}: {exc}")
+                raise
+    log_info(
+        f"Wrote {len(changed)} files under {stack_root} "
+        f"({len(entries) - len(changed)} unchanged)"
+    )
+    return changed
 
 
-def create_stack_files(stack_root: Path) -> None:
-    # scripts/common.sh
-    safe_write(
-        stack_root / "scripts" / "common.sh",
-        r"""
+def _strip_indent(content: str, n: int = 8) -> str:
+    """Remove a fixed n-space indent from every line of content.
+
+    All templates below are written with an 8-space indent, so this avoids
+    textwrap.dedent's search for the common margin. Falls back to
+    textwrap.dedent if any non-blank line does not carry the full indent.
+    """
+    prefix = " " * n
+    lines = content.split("\n")
+    if not all(line.startswith(prefix) or not line.strip() for line in lines):
+        return textwrap.dedent(content)
+    return "\n".join(line[n:] if line.strip() else "" for line in lines)
+
+
+def _template(content: str) -> str:
+    """Dedent and strip a heredoc template (applied once, at import time)."""
+    return _strip_indent(content).lstrip("\n")
+
+
+# scripts/common.sh
+_COMMON_SH: Final[str] = _template(
+    r"""
         #!/usr/bin/env bash
         # Common utilities for Modular CPU AI Stack v0.1.6
         # Provides logging and dependency checks.
@@ -175,13 +337,13 @@ def create_stack_files(stack_root: Path) -> None:
                 exit 1
             fi
         }
-        """,
-    )
+        """
+)
 
-    # scripts/install_llm.sh (with Ollama data dir fix)
-    safe_write(
-        stack_root / "scripts" / "install_llm.sh",
-        r"""
+
+# scripts/install_llm.sh (with Ollama data dir fix)
+_INSTALL_LLM_SH: Final[str] = _template(
+    r"""
         #!/usr/bin/env bash
         # Install / launch LLM + Open WebUI subsystem
 
@@ -205,13 +367,13 @@ def create_stack_files(stack_root: Path) -> None:
         compose_up "llm-subsystem" "ollama" "open-webui"
 
         log_info "${SCRIPT_NAME}" "LLM + Open WebUI subsystem is up. Access Open WebUI via http://<docker-host-ip>:3000"
-        """,
-    )
+        """
+)
+
 
-    # scripts/install_image_gen.sh
-    safe_write(
-        stack_root / "scripts" / "install_image_gen.sh",
-        r"""
+# scripts/install_image_gen.sh
+_INSTALL_IMAGE_GEN_SH: Final[str] = _template(
+    r"""
         #!/usr/bin/env bash
         # Install / launch Image Generation (e.g., ComfyUI) subsystem
 
@@ -227,13 +389,13 @@ def create_stack_files(stack_root: Path) -> None:
         compose_up "image-gen-subsystem" "comfyui"
 
         log_info "${SCRIPT_NAME}" "Image Generation subsystem is up. Access ComfyUI via http://<docker-host-ip>:8188"
-        """,
-    )
+        """
+)
+
 
-    # scripts/install_tts.sh (still only Wyoming-Piper; HTTP adapter can be added later)
-    safe_write(
-        stack_root / "scripts" / "install_tts.sh",
-        r"""
+# scripts/install_tts.sh (still only Wyoming-Piper; HTTP adapter can be added later)
+_INSTALL_TTS_SH: Final[str] = _template(
+    r"""
         #!/usr/bin/env bash
         # Install / launch TTS subsystem (Wyoming-Piper)
 
@@ -249,13 +411,13 @@ def create_stack_files(stack_root: Path) -> None:
         compose_up "tts-subsystem" "wyoming-piper"
 
         log_info "${SCRIPT_NAME}" "TTS subsystem is up on tcp://<docker-host-ip>:10200"
-        """,
-    )
+        """
+)
 
-    # scripts/download_ollama_models.sh (with cleaned list + index handling)
-    safe_write(
-        stack_root / "scripts" / "download_ollama_models.sh",
-        r"""
+
+# scripts/download_ollama_models.sh (with cleaned list + index handling)
+_DOWNLOAD_OLLAMA_MODELS_SH: Final[str] = _template(
+    r"""
         #!/usr/bin/env bash
         # Interactive Ollama model manager for the Modular CPU AI Stack
 
@@ -394,13 +556,13 @@ def create_stack_files(stack_root: Path) -> None:
 
         log_info "${SCRIPT_NAME}" "Starting Ollama model manager."
         interactive_menu
-        """,
-    )
+        """
+)
+
 
-    # scripts/health_check.sh
-    safe_write(
-        stack_root / "scripts" / "health_check.sh",
-        r"""
+# scripts/health_check.sh
+_HEALTH_CHECK_SH: Final[str] = _template(
+    r"""
         #!/usr/bin/env bash
         # Health check for Modular CPU AI Stack v0.1.6
 
@@ -443,13 +605,13 @@ def create_stack_files(stack_root: Path) -> None:
             echo "One or more services are not running. Check ${ERROR_LOG} for details."
             exit 1
         fi
-        """,
-    )
+        """
+)
+
 
-    # scripts/clean_stack.sh
-    safe_write(
-        stack_root / "scripts" / "clean_stack.sh",
-        r"""
+# scripts/clean_stack.sh
+_CLEAN_STACK_SH: Final[str] = _template(
+    r"""
         #!/usr/bin/env bash
         # Clean up Modular CPU AI Stack containers (and optionally volumes)
 
@@ -484,13 +646,13 @@ def create_stack_files(stack_root: Path) -> None:
             fi
             log_info "${SCRIPT_NAME}" "Stack containers have been removed (volumes preserved)."
         fi
-        """,
-    )
+        """
+)
 
-    # scripts/setup_oauth.sh (helper you provided, wired into logging)
-    safe_write(
-        stack_root / "scripts" / "setup_oauth.sh",
-        r"""
+
+# scripts/setup_oauth.sh (helper you provided, wired into logging)
+_SETUP_OAUTH_SH: Final[str] = _template(
+    r"""
         #!/usr/bin/env bash
         # Helper to configure OAuth secrets and load them into a selected container/image.
 
@@ -571,13 +733,13 @@ def create_stack_files(stack_root: Path) -> None:
 
         echo "Configuration files have been successfully loaded into the container."
         log_info "${SCRIPT_NAME}" "OAuth configuration helper completed."
-        """,
-    )
+        """
+)
+
 
-    # install.sh main menu
-    safe_write(
-        stack_root / "install.sh",
-        r"""
+# install.sh main menu
+_INSTALL_SH: Final[str] = _template(
+    r"""
         #!/usr/bin/env bash
         # Modular CPU AI Stack v0.1.6 - Main installer / launcher menu
 
@@ -637,13 +799,13 @@ def create_stack_files(stack_root: Path) -> None:
 
         log_info "${SCRIPT_NAME}" "Launching main installer menu."
         main_menu
-        """,
-    )
+        """
+)
+
 
-    # docker-compose.yml
-    safe_write(
-        stack_root / "docker-compose.yml",
-        r"""
+# docker-compose.yml
+_DOCKER_COMPOSE_YML: Final[str] = _template(
+    r"""
         services:
           ollama:
             image: ollama/ollama:latest
@@ -691,13 +853,13 @@ def create_stack_files(stack_root: Path) -> None:
               - "10200:10200"
             volumes:
               - ./data/piper:/data
-        """,
-    )
+        """
+)
 
-    # README.md
-    safe_write(
-        stack_root / "README.md",
-        f"""
+
+# README.md
+_README_MD: Final[str] = _template(
+    f"""
         # Modular CPU AI Stack v{VERSION}
 
         This version corresponds to the modular, menu-driven stack that we are using
@@ -731,13 +893,13 @@ def create_stack_files(stack_root: Path) -> None:
         - `logs/stack_errors.log`
 
         Every error message references `logs/stack_errors.log` for easier debugging.
-        """,
-    )
-
-    # CHANGELOG.md
-    safe_write(
-        stack_root / "CHANGELOG.md",
         """
+)
+
+
+# CHANGELOG.md
+_CHANGELOG_MD: Final[str] = _template(
+    """
         # Changelog - Modular CPU AI Stack
 
         ## 0.1.6
@@ -752,13 +914,13 @@ def create_stack_files(stack_root: Path) -> None:
         - Centralized logging via `scripts/common.sh` with explicit error log reference.
         - Added OAuth helper script (`scripts/setup_oauth.sh`).
         - Fixed Ollama data directory handling to avoid 400 errors on `ollama pull`.
-        """,
-    )
-
-    # session restart prompt
-    safe_write(
-        stack_root / "session_restart_prompt_v0_1_6.md",
         """
+)
+
+
+# session restart prompt
+_SESSION_RESTART_PROMPT_MD: Final[str] = _template(
+    """
         # Session Restart Prompt - Modular CPU AI Stack v0.1.6
 
         You are helping with the Modular CPU AI Stack v0.1.6, a CPU-only Docker stack
@@ -796,20 +958,97 @@ def create_stack_files(stack_root: Path) -> None:
 
         When continuing work, assume this version is the "good" baseline and new versions
         should build on it without losing modularity or tooling.
-        """,
-    )
+        """
+)
+
+
+def build_entries() -> List[Tuple[str, str]]:
+    """Return the generated stack as (path relative to stack root, content)."""
+    return [
+        ("scripts/common.sh", _COMMON_SH),
+        ("scripts/install_llm.sh", _INSTALL_LLM_SH),
+        ("scripts/install_image_gen.sh", _INSTALL_IMAGE_GEN_SH),
+        ("scripts/install_tts.sh", _INSTALL_TTS_SH),
+        ("scripts/download_ollama_models.sh", _DOWNLOAD_OLLAMA_MODELS_SH),
+        ("scripts/health_check.sh", _HEALTH_CHECK_SH),
+        ("scripts/clean_stack.sh", _CLEAN_STACK_SH),
+        ("scripts/setup_oauth.sh", _SETUP_OAUTH_SH),
+        ("install.sh", _INSTALL_SH),
+        ("docker-compose.yml", _DOCKER_COMPOSE_YML),
+        ("README.md", _README_MD),
+        ("CHANGELOG.md", _CHANGELOG_MD),
+        ("session_restart_prompt_v0_1_6.md", _SESSION_RESTART_PROMPT_MD),
+    ]
+
+
+def _zip_compression() -> Tuple[int, Optional[int]]:
+    """Return (compression, compresslevel) for the archive from STACK_ZIP_LEVEL."""
+    raw = os.environ.get("STACK_ZIP_LEVEL", "0")
+    try:
+        level = int(raw)
+    except ValueError:
+        level = -1
+    if not 0 <= level <= 9:
+        raise ValueError(f"STACK_ZIP_LEVEL must be an integer 0-9, got {raw!r}")
+    if level == 0:
+        return zipfile.ZIP_STORED, None
+    return zipfile.ZIP_DEFLATED, level
+
+
+def _write_zip(
+    zip_path: Path, members: Iterable[Tuple[zipfile.ZipInfo, bytes]]
+) -> bool:
+    """Build the archive in memory and replace zip_path with a single write.
+
+    A failed run therefore never leaves a truncated ZIP behind. If the
+    existing archive is byte-identical it is left alone. Returns True if
+    zip_path was written.
+    """
+    compression, level = _zip_compression()
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression, compresslevel=level) as zf:
+        for info, data in members:
+            zf.writestr(
+                info, data, compress_type=compression, compresslevel=level
+            )
+    data = buf.getvalue()
+    try:
+        if zip_path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    tmp_path = zip_path.with_suffix(".zip.tmp")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, zip_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return True
 
 
-def create_zip(stack_root: Path) -> Path:
+def create_zip_from_entries(
+    stack_root: Path, entries: List[Tuple[str, str]]
+) -> Path:
+    """Archive the generated entries straight from memory (no read-back).
+
+    Entries are stored sorted by path with a fixed timestamp and the same
+    permissions materialize gives the files on disk, so the same entries
+    always produce a byte-identical archive.
+    """
     zip_path = ROOT_DIR / f"{stack_root.name}.zip"
+
+    def members() -> Iterator[Tuple[zipfile.ZipInfo, bytes]]:
+        for relpath, content in sorted(entries):
+            info = zipfile.ZipInfo(f"{stack_root.name}/{relpath}", ZIP_DATE_TIME)
+            info.external_attr = (stat.S_IFREG | _file_mode(relpath)) << 16
+            yield info, content.encode("utf-8")
+
     try:
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            for folder, _, files in os.walk(stack_root):
-                for name in files:
-                    full = Path(folder) / name
-                    rel = full.relative_to(ROOT_DIR)
-                    zf.write(full, arcname=rel)
-        log_info(f"Created ZIP archive: {zip_path}")
+        if _write_zip(zip_path, members()):
+            log_info(f"Created ZIP archive: {zip_path}")
+        else:
+            log_info(f"ZIP archive unchanged: {zip_path}")
         return zip_path
     except Exception as exc:
         log_error(f"Failed to create zip {zip_path}: {exc}")
@@ -817,32 +1056,30 @@ def create_zip(stack_root: Path) -> Path:
 
 
 def main() -> None:
+    if hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(line_buffering=True)
     log_info(f"Generating stack version {VERSION} in {ROOT_DIR}")
 
     stack_root = ROOT_DIR / STACK_DIR_NAME
 
     if stack_root.exists():
         log_info(
-            f"Target directory already exists: {stack_root} (will overwrite files)."
+            f"Target directory already exists: {stack_root} "
+            "(changed files will be rewritten)."
         )
     else:
         stack_root.mkdir(parents=True, exist_ok=True)
         log_info(f"Created stack root directory: {stack_root}")
 
     try:
-        create_stack_files(stack_root)
-
-        # Mark scripts executable
-        scripts_dir = stack_root / "scripts"
-        for sh in scripts_dir.glob("*.sh"):
-            make_executable(sh)
-        make_executable(stack_root / "install.sh")
+        entries = build_entries()
+        materialize(stack_root, entries)
 
         # Make empty logs dir
         (stack_root / "logs").mkdir(parents=True, exist_ok=True)
 
-        # Create zip archive
-        zip_path = create_zip(stack_root)
+        # Create zip archive (left untouched if its bytes would not change)
+        zip_path = create_zip_from_entries(stack_root, entries)
 
         log_info(f"Stack files generation complete for {VERSION}.")
         log_info(f"Root directory: {stack_root}")